@@ -1 +1 @@
-from .ffprobe import FFProbe
+from .ffprobe import FFProbe, probe_many, probe_many_async
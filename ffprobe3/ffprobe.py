@@ -1,16 +1,60 @@
 """
 Python wrapper for ffprobe command line tool. ffprobe must exist in the path.
 """
+import asyncio
 import functools
-import operator
+import json
 import os
-import pipes
-import platform
 import subprocess
 import re
+import shutil
+import sys
 
 from ffprobe3.exceptions import FFProbeError
 
+_SUMMARY_BIT_RE = re.compile(rb'Duration: \d+:[^\n]*?bitrate: (?P<bit>\d{1,8}) kb/s')
+
+_FFPROBE = shutil.which('ffprobe')
+_PROBE_ARGS = ('-show_streams', '-show_format', '-of', 'json')
+
+
+def _flatten(section: dict) -> dict:
+    """
+    Flattens the nested tags/disposition objects of ffprobe's json output into the TAG:key and
+    DISPOSITION:key names used by its default output format, with every value as a string like
+    that format gives.
+    """
+    attrs = {}
+    for key, value in section.items():
+        if key == 'tags':
+            attrs.update(('TAG:' + k, str(v)) for k, v in value.items())
+        elif key == 'disposition':
+            attrs.update(('DISPOSITION:' + k, str(v)) for k, v in value.items())
+        elif isinstance(value, (dict, list)):
+            attrs[key] = value
+        else:
+            attrs[key] = str(value)
+    return attrs
+
+
+_MISSING = object()
+
+
+def _cached(method):
+    """
+    Memoises a no-argument FFStream accessor in the instance's _cache slot. Errors are not cached.
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self):
+        value = self._cache.get(name, _MISSING)
+        if value is _MISSING:
+            value = self._cache[name] = method(self)
+        return value
+
+    return wrapper
+
 
 class FFProbe:
     """
@@ -20,105 +64,106 @@ class FFProbe:
 
     def __init__(self, path_to_video: str):
         self.path_to_video = path_to_video
-        self.bit_re = re.compile(r'\ \d{1,8}\ [a-z]b')
-        self.stream_re = re.compile(r'Duration: [0=9]+:')
-        self.stream_index_re = re.compile(r'#[0-9]+:[0-9]+\(')
 
-        try:
-            with open(os.devnull, 'w') as tempf:
-                subprocess.check_call(["ffprobe", "-h"], stdout=tempf, stderr=tempf)
-        except FileNotFoundError:
+        if _FFPROBE is None:
             raise IOError('ffprobe not found.')
 
-        stdout, stderr = self.probe(self.path_to_video, '-show_streams')
-        stream = False
-        self.streams = []
+        if not os.path.isfile(self.path_to_video):
+            raise IOError('No such media file ' + self.path_to_video)
+
+        stdout, stderr = self.probe(self.path_to_video, *_PROBE_ARGS)
+
+        self._load(stdout, stderr)
+
+    @classmethod
+    def _from_output(cls, path_to_video: str, stdout: bytes, stderr: bytes) -> 'FFProbe':
+        """
+        Builds an FFProbe from the output of an ffprobe run made elsewhere, see probe_many().
+        """
+        probe = cls.__new__(cls)
+        probe.path_to_video = path_to_video
+        probe._load(stdout, stderr)
+        return probe
+
+    def _load(self, stdout: bytes, stderr: bytes):
+        """
+        Populates the streams and container from the json written by ffprobe on stdout, falling
+        back to the stderr summary for the container bit rate.
+        """
         self.video = []
         self.audio = []
         self.subtitle = []
         self.attachment = []
-        self.container = []
-
-        for line in stdout:
-            if '[STREAM]' in line:
-                stream = True
-                data_lines = []
-            elif '[/STREAM]' in line and stream:
-                stream = False
-                # noinspection PyUnboundLocalVariable
-                self.streams.append(FFStream(data_lines))
-            elif stream:
-                data_lines.append(line)
-
-        for line in stderr:
-            if '[STREAM]' in line:
-                stream = True
-                data_lines = []
-            elif '[/STREAM]' in line and stream:
-                stream = False
-                self.streams.append(FFStream(data_lines))
-            elif stream:
-                data_lines.append(line)
 
+        try:
+            data = json.loads(stdout or b'{}')
+        except ValueError as error:
+            raise FFProbeError('Unparseable ffprobe output for ' + self.path_to_video) from error
+        self.streams = [FFStream(_flatten(s)) for s in data.get('streams', [])]
+
+        container = _flatten(data.get('format', {}))
+        if 'bit_rate' not in container:
+            # Matroska containers don't always report bit_rate, but it can still be parsed from the
+            # container summary ffprobe always prints to stderr; the raw bytes are scanned without decoding
+            bit_match = _SUMMARY_BIT_RE.search(stderr)
+            # no match for "bitrate: N/A", or for any unit other than the kb/s the * 1000 assumes
+            if bit_match is not None:
+                container['bit_rate'] = int(bit_match.group('bit')) * 1000
+        self.container = [FFContainer(container)]
+
+        buckets = {'audio': self.audio, 'video': self.video, 'subtitle': self.subtitle, 'attachment': self.attachment}
         for stream in self.streams:
-            if stream.is_audio():
-                self.audio.append(stream)
-            elif stream.is_video():
-                self.video.append(stream)
-            elif stream.is_subtitle():
-                self.subtitle.append(stream)
-            elif stream.is_attachment():
-                self.attachment.append(stream)
-
-        # Matroska containers don't have bit_rate metadata, but it can still be parsed from stderr
-        mkvout, mkverr = self.probe(self.path_to_video)
-        for line in mkverr:
-            if self.stream_re.search(line):
-                bit_match = self.bit_re.search(line).group()
-                bit_match = re.sub("[^0-9]", "", bit_match)
-                self.container.append(FFContainer(['container_bitrate={}'.format(bit_match)]))
+            bucket = buckets.get(stream._attrs.get('codec_type'))
+            if bucket is not None:
+                bucket.append(stream)
 
     def __repr__(self) -> str:
         return "<FFprobe: {video}, {audio}, {subtitle}, {attachment}>".format(**vars(self))
 
-    def probe(self, video_path: str, *args: str) -> str:
-        if os.path.isfile(self.path_to_video):
-            if platform.system() == 'Windows':
-                if len(args) == 0:
-                    cmd = ["ffprobe", video_path]
-                else:
-                    cmd = ["ffprobe", args, video_path]
-            else:
-                if len(args) == 0:
-                    cmd = ["ffprobe" + pipes.quote(video_path)]
-                else:
-                    cmd = ["ffprobe", args + pipes.quote(video_path)]
-            stdout, stderr = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True).communicate()
-            stdout = stdout.decode('UTF-8').splitlines()
-            stderr = stderr.decode('UTF-8').splitlines()
-            return stdout, stderr
-        else:
-            raise IOError('No such media file ' + self.path_to_video)
+    def probe(self, video_path: str, *args: str) -> tuple:
+        cp = subprocess.run([_FFPROBE, *args, video_path], capture_output=True, check=False)
+        return cp.stdout, cp.stderr
 
 
-class FFStream:
+class _Fields:
     """
-    An object representation of an individual stream in a multimedia file.
+    Base for the objects built from a section of ffprobe output. The raw fields are kept in _attrs
+    and are also reachable as attributes, e.g. stream.width.
     """
+    __slots__ = ('_attrs',)
 
-    def __init__(self, data_lines: list):
-        for line in data_lines:
-            self.__dict__.update({key: value for key, value, *_ in [line.strip().split('=')]})
+    def __init__(self, attrs: dict):
+        self._attrs = attrs
 
-            try:
-                self.__dict__['framerate'] = round(
-                    functools.reduce(
-                        operator.truediv, map(int, self.__dict__.get('avg_frame_rate', '').split('/'))
-                    )
-                )
+    def __getattr__(self, name):
+        try:
+            return object.__getattribute__(self, '_attrs')[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+class FFStream(_Fields):
+    """
+    An object representation of an individual stream in a multimedia file.
+    """
+    __slots__ = ('_cache',)
 
-            except (ValueError, ZeroDivisionError):
-                self.__dict__['framerate'] = None
+    def __init__(self, attrs: dict):
+        super().__init__(attrs)
+        self._cache = {}
+
+    @property
+    @_cached
+    def framerate(self) -> int:
+        """
+        Returns the average frame rate rounded to a whole number, parsed on first access.
+        Returns None if the stream has no usable avg_frame_rate.
+        """
+        try:
+            num, _, den = self._attrs.get('avg_frame_rate', '0/0').partition('/')
+            return round(int(num) / int(den)) if den and int(den) else None
+        except (ValueError, ZeroDivisionError):
+            return None
 
     def __repr__(self) -> dict:
         if self.is_video():
@@ -134,31 +179,31 @@ class FFStream:
         else:
             template = ''
 
-        return template.format(**self.__dict__)
+        return template.format(**dict(self._attrs, framerate=self.framerate))
 
     def is_audio(self) -> dict:
         """
         Is this stream labelled as an audio stream?
         """
-        return self.__dict__.get('codec_type', None) == 'audio'
+        return self._attrs.get('codec_type', None) == 'audio'
 
     def is_video(self) -> dict:
         """
         Is the stream labelled as a video stream.
         """
-        return self.__dict__.get('codec_type', None) == 'video'
+        return self._attrs.get('codec_type', None) == 'video'
 
     def is_subtitle(self) -> dict:
         """
         Is the stream labelled as a subtitle stream.
         """
-        return self.__dict__.get('codec_type', None) == 'subtitle'
+        return self._attrs.get('codec_type', None) == 'subtitle'
 
     def is_attachment(self) -> dict:
         """
         Is the stream labelled as a attachment stream.
         """
-        return self.__dict__.get('codec_type', None) == 'attachment'
+        return self._attrs.get('codec_type', None) == 'attachment'
 
     def frame_size(self) -> tuple:
         """
@@ -167,8 +212,8 @@ class FFStream:
         """
         size = None
         if self.is_video():
-            width = self.__dict__['width']
-            height = self.__dict__['height']
+            width = self._attrs['width']
+            height = self._attrs['height']
 
             if width and height:
                 try:
@@ -185,15 +230,16 @@ class FFStream:
         Returns a string representing the pixel format of the video stream. e.g. yuv420p.
         Returns none is it is not a video stream.
         """
-        return self.__dict__.get('pix_fmt', None)
+        return self._attrs.get('pix_fmt', None)
 
+    @_cached
     def frames(self) -> int:
         """
         Returns the length of a video stream in frames. Returns 0 if not a video stream.
         """
         if self.is_video() or self.is_audio():
             try:
-                frame_count = int(self.__dict__.get('nb_frames', ''))
+                frame_count = int(self._attrs.get('nb_frames', ''))
             except ValueError:
                 raise FFProbeError('None integer frame count')
         else:
@@ -201,6 +247,7 @@ class FFStream:
 
         return frame_count
 
+    @_cached
     def duration_seconds(self) -> int:
         """
         Returns the runtime duration of the video stream as a floating point number of seconds.
@@ -208,7 +255,7 @@ class FFStream:
         """
         if self.is_video() or self.is_audio():
             try:
-                duration = float(self.__dict__.get('duration', ''))
+                duration = float(self._attrs.get('duration', ''))
             except ValueError:
                 raise FFProbeError('None numeric duration')
         else:
@@ -220,48 +267,104 @@ class FFStream:
         """
         Returns language tag of stream. e.g. eng
         """
-        return self.__dict__.get('TAG:language', None)
+        return self._attrs.get('TAG:language', None)
 
     def codec(self) -> str:
         """
         Returns a string representation of the stream codec.
         """
-        return self.__dict__.get('codec_name', None)
+        return self._attrs.get('codec_name', None)
 
     def codec_description(self) -> str:
         """
         Returns a long representation of the stream codec.
         """
-        return self.__dict__.get('codec_long_name', None)
+        return self._attrs.get('codec_long_name', None)
 
     def codec_tag(self) -> str:
         """
         Returns a short representative tag of the stream codec.
         """
-        return self.__dict__.get('codec_tag_string', None)
+        return self._attrs.get('codec_tag_string', None)
 
+    @_cached
     def bit_rate(self) -> int:
         """
         Returns bit_rate as an integer in bps
         """
         try:
-            return int(self.__dict__.get('bit_rate', ''))
+            return int(self._attrs.get('bit_rate', ''))
         except ValueError:
             raise FFProbeError('None integer bit_rate')
 
-class FFContainer:
+
+class FFContainer(_Fields):
     """
     An object representation of a container for media streams
     """
-    def __init__(self, data_lines):
-        for line in data_lines:
-            self.__dict__.update({key: value for key, value in [line.strip().split('=')]})
+    __slots__ = ()
 
     def container_bitrate(self) -> int:
         """
         Returns container_bitrate as an integer in bps
         """
+        bit_rate = self._attrs.get('bit_rate', '')
+        if isinstance(bit_rate, int):
+            # scraped from the stderr summary, already in bps
+            return bit_rate
         try:
-            return int(self.__dict__.get('container_bitrate', ''))
+            return int(bit_rate)
         except ValueError:
             raise FFProbeError('None integer container_bitrate')
+
+
+def probe_many(paths, *, max_workers: int = None) -> list:
+    """
+    Probes several media files concurrently, running up to max_workers ffprobe processes at a time
+    (the number of CPUs by default). Returns FFProbe objects in the same order as paths::
+        metadata=probe_many(['first-file.mov', 'second-file.mkv'])
+
+    From inside a running event loop, await probe_many_async() instead.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        raise RuntimeError('probe_many() cannot be called from a running event loop, '
+                           'await probe_many_async() instead')
+
+    if sys.platform == 'win32' and sys.version_info < (3, 8):
+        # asyncio.run() uses a selector loop here, which cannot start subprocesses
+        loop = asyncio.ProactorEventLoop()
+        try:
+            return loop.run_until_complete(probe_many_async(paths, max_workers=max_workers))
+        finally:
+            loop.close()
+
+    return asyncio.run(probe_many_async(paths, max_workers=max_workers))
+
+
+async def probe_many_async(paths, *, max_workers: int = None) -> list:
+    """
+    Coroutine version of probe_many()::
+        metadata=await probe_many_async(['first-file.mov', 'second-file.mkv'])
+    """
+    if _FFPROBE is None:
+        raise IOError('ffprobe not found.')
+
+    paths = list(paths)
+    for path in paths:
+        if not os.path.isfile(path):
+            raise IOError('No such media file ' + path)
+
+    semaphore = asyncio.Semaphore(max_workers or os.cpu_count() or 1)
+
+    async def probe_one(path):
+        async with semaphore:
+            proc = await asyncio.create_subprocess_exec(_FFPROBE, *_PROBE_ARGS, path,
+                                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = await proc.communicate()
+        return FFProbe._from_output(path, stdout, stderr)
+
+    return await asyncio.gather(*(probe_one(path) for path in paths))
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-from distutils.core import setup
+from setuptools import setup
 
 setup(
     name='ffprobe3',
@@ -18,6 +18,7 @@ setup(
     maintainer_email='dheeru.rathor14@gmail.com',
     url='https://github.com/DheerendraRathor/ffprobe3',
     packages=['ffprobe3'],
+    python_requires='>=3.7',
     keywords='ffmpeg, ffprobe, mpeg, mp4',
     classifiers=[
         'Development Status :: 4 - Beta',
@@ -28,8 +29,14 @@ setup(
         'Operating System :: Microsoft :: Windows',
         'Operating System :: POSIX',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
         'Programming Language :: Python :: Implementation :: CPython',
         'Natural Language :: English',
         'Topic :: Multimedia :: Video',
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import os
+import unittest
+import warnings
+from unittest import mock
+
+from ffprobe3.ffprobe import FFProbe, probe_many, probe_many_async
+from ffprobe3.exceptions import FFProbeError
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_VIDEOS = [
+    os.path.join(TEST_DIR, 'data', 'SampleVideo_720x480_5mb.mp4'),
+    os.path.join(TEST_DIR, 'data', 'SampleVideo_1280x720_1mb.mp4'),
+    os.path.join(TEST_DIR, 'data', 'SampleVideo_360x240_50mb.mp4'),
+    os.path.join(TEST_DIR, 'data', 'SampleVideo_1280x720_50mb.mp4'),
+]
+
+STREAMS = [
+    {
+        'index': 0, 'codec_name': 'h264', 'codec_long_name': 'H.264 / AVC', 'codec_type': 'video',
+        'width': 1280, 'height': 720, 'avg_frame_rate': '25/1', 'nb_frames': '132', 'duration': '5.280000',
+        'bit_rate': '1500000', 'tags': {'language': 'eng'}, 'disposition': {'default': 1, 'forced': 0},
+    },
+    {
+        'index': 1, 'codec_name': 'aac', 'codec_long_name': 'AAC', 'codec_type': 'audio', 'channels': 2,
+        'channel_layout': 'stereo', 'sample_rate': '48000', 'avg_frame_rate': '0/0', 'duration': '5.31',
+        'tags': {'language': 'fre'},
+    },
+    {'index': 2, 'codec_name': 'subrip', 'codec_long_name': 'SubRip subtitle', 'codec_type': 'subtitle'},
+    {'index': 3, 'codec_name': 'ttf', 'codec_long_name': 'TrueType font', 'codec_type': 'attachment'},
+]
+
+STDERR = b"""Input #0, matroska,webm, from 'x.mkv':
+  Duration: 00:00:05.31, start: 0.000000, bitrate: %s
+  Stream #0:0(eng): Video: h264, yuv420p, 1280x720, 1500 kb/s, 25 fps
+"""
+
+
+def probe_output(fmt: dict) -> bytes:
+    return json.dumps({'streams': STREAMS, 'format': fmt}).encode()
+
+
+class FFProbeOutputTest(unittest.TestCase):
+
+    def test_streams(self):
+        media = FFProbe._from_output('x.mkv', probe_output({'format_name': 'matroska,webm'}), STDERR % b'1589 kb/s')
+
+        self.assertEqual(len(media.streams), 4)
+        self.assertEqual([s.index for s in media.video], ['0'])
+        self.assertEqual([s.index for s in media.audio], ['1'])
+        self.assertEqual([s.index for s in media.subtitle], ['2'])
+        self.assertEqual([s.index for s in media.attachment], ['3'])
+
+        video, audio = media.video[0], media.audio[0]
+        self.assertEqual(video.language(), 'eng')
+        self.assertEqual(audio.language(), 'fre')
+        self.assertEqual(video._attrs['DISPOSITION:default'], '1')
+        self.assertEqual(video._attrs['DISPOSITION:forced'], '0')
+        self.assertNotIn('tags', video._attrs)
+        self.assertEqual(audio.channels, '2')
+        self.assertEqual(video.frame_size(), (1280, 720))
+        self.assertEqual(video.framerate, 25)
+        self.assertIsNone(audio.framerate)
+        self.assertEqual(video.frames(), 132)
+        self.assertEqual(video.bit_rate(), 1500000)
+        self.assertRaises(FFProbeError, audio.frames)
+
+    def test_raw_fields_as_attributes(self):
+        media = FFProbe._from_output('x.mkv', probe_output({'format_name': 'matroska,webm'}), b'')
+        video, container = media.video[0], media.container[0]
+
+        self.assertEqual(video.codec_name, 'h264')
+        self.assertEqual(getattr(video, 'TAG:language'), 'eng')
+        self.assertEqual(container.format_name, 'matroska,webm')
+        self.assertTrue(callable(video.bit_rate))
+        self.assertFalse(hasattr(video, 'nb_streams'))
+        self.assertFalse(hasattr(container, 'nb_streams'))
+        self.assertFalse(hasattr(video, '__dict__'))
+        self.assertFalse(hasattr(container, '__dict__'))
+
+    def test_accessor_errors_are_not_chained(self):
+        media = FFProbe._from_output('x.mkv', probe_output({}), b'')
+        with self.assertRaises(FFProbeError) as raised:
+            media.audio[0].frames()
+        self.assertIsInstance(raised.exception.__context__, ValueError)
+        self.assertIsNone(raised.exception.__context__.__context__)
+
+    def test_container_bitrate_from_format(self):
+        media = FFProbe._from_output('x.mp4', probe_output({'bit_rate': '1234000'}), STDERR % b'1589 kb/s')
+        self.assertEqual(media.container[0].container_bitrate(), 1234000)
+
+    def test_container_bitrate_from_stderr(self):
+        media = FFProbe._from_output('x.mkv', probe_output({}), STDERR % b'1589 kb/s')
+        self.assertIsInstance(media.container[0]._attrs['bit_rate'], int)
+        self.assertEqual(media.container[0].container_bitrate(), 1589000)
+
+    def test_container_bitrate_not_available(self):
+        media = FFProbe._from_output('x.mkv', probe_output({}), STDERR % b'N/A')
+        self.assertRaises(FFProbeError, media.container[0].container_bitrate)
+
+    def test_container_bitrate_other_unit(self):
+        media = FFProbe._from_output('x.mkv', probe_output({}), STDERR % b'2 mb/s')
+        self.assertRaises(FFProbeError, media.container[0].container_bitrate)
+
+    def test_unparseable_output(self):
+        self.assertRaises(FFProbeError, FFProbe._from_output, 'x.mkv', probe_output({})[:40], b'')
+
+
+
+class ProbeCommandTest(unittest.TestCase):
+
+    @mock.patch('ffprobe3.ffprobe._FFPROBE', '/usr/bin/ffprobe')
+    @mock.patch('ffprobe3.ffprobe.subprocess.run')
+    def test_flat_argv_without_shell(self, run):
+        run.return_value = mock.Mock(stdout=b'{}', stderr=b'')
+
+        media = FFProbe(TEST_VIDEOS[0])
+
+        (cmd,), kwargs = run.call_args
+        self.assertEqual(cmd, ['/usr/bin/ffprobe', '-show_streams', '-show_format', '-of', 'json', TEST_VIDEOS[0]])
+        self.assertFalse(kwargs.get('shell', False))
+        self.assertEqual(media.streams, [])
+
+    @mock.patch('ffprobe3.ffprobe._FFPROBE', '/usr/bin/ffprobe')
+    @mock.patch('ffprobe3.ffprobe.subprocess.run')
+    def test_path_with_spaces_is_one_argument(self, run):
+        run.return_value = mock.Mock(stdout=b'{}', stderr=b'')
+
+        self.assertEqual(FFProbe.__new__(FFProbe).probe('my video; rm -rf.mkv', '-show_streams'),
+                         (b'{}', b''))
+        (cmd,), kwargs = run.call_args
+        self.assertEqual(cmd, ['/usr/bin/ffprobe', '-show_streams', 'my video; rm -rf.mkv'])
+
+
+class FakeProcess:
+    """
+    Stands in for an asyncio subprocess, finishing sooner the later its file comes in TEST_VIDEOS.
+    """
+    running = 0
+    peak = 0
+
+    def __init__(self, path):
+        self.path = path
+
+    async def communicate(self):
+        FakeProcess.running += 1
+        FakeProcess.peak = max(FakeProcess.peak, FakeProcess.running)
+        await asyncio.sleep(0.01 * (len(TEST_VIDEOS) - TEST_VIDEOS.index(self.path)))
+        FakeProcess.running -= 1
+        return probe_output({'filename': self.path}), b''
+
+
+async def fake_exec(program, *args, **kwargs):
+    return FakeProcess(args[-1])
+
+
+@mock.patch('ffprobe3.ffprobe._FFPROBE', '/usr/bin/ffprobe')
+@mock.patch('ffprobe3.ffprobe.asyncio.create_subprocess_exec', side_effect=fake_exec)
+class ProbeManyTest(unittest.TestCase):
+
+    def setUp(self):
+        FakeProcess.running = FakeProcess.peak = 0
+
+    def test_results_in_input_order(self, create_subprocess_exec):
+        results = probe_many(TEST_VIDEOS)
+
+        self.assertEqual([m.path_to_video for m in results], TEST_VIDEOS)
+        self.assertEqual([m.container[0].filename for m in results], TEST_VIDEOS)
+        self.assertEqual(create_subprocess_exec.call_args[0][:-1],
+                         ('/usr/bin/ffprobe', '-show_streams', '-show_format', '-of', 'json'))
+
+    def test_max_workers(self, create_subprocess_exec):
+        probe_many(TEST_VIDEOS, max_workers=2)
+        self.assertEqual(FakeProcess.peak, 2)
+
+        FakeProcess.peak = 0
+        probe_many(TEST_VIDEOS, max_workers=1)
+        self.assertEqual(FakeProcess.peak, 1)
+
+    def test_missing_file(self, create_subprocess_exec):
+        self.assertRaises(IOError, probe_many, TEST_VIDEOS + ['missing.mkv'])
+        create_subprocess_exec.assert_not_called()
+
+    def test_running_event_loop(self, create_subprocess_exec):
+        async def probe():
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                self.assertRaises(RuntimeError, probe_many, TEST_VIDEOS)
+            self.assertEqual(caught, [])
+            return await probe_many_async(TEST_VIDEOS)
+
+        results = asyncio.run(probe())
+        self.assertEqual([m.path_to_video for m in results], TEST_VIDEOS)
+
+
+if __name__ == '__main__':
+    unittest.main()